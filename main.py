@@ -11,16 +11,41 @@ DarkLook - Публичный Telegram бот для мониторинга пр
 """
 
 import asyncio
+from abc import ABC, abstractmethod
+import csv
+import faulthandler
+import gzip
+import importlib
+import io
+import json
 import logging
+import sqlite3
+import sys
+import tempfile
+import threading
+import traceback
+import time
+from array import array
+from bisect import bisect_left, bisect_right
 import aiosqlite
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
-from collections import defaultdict
+from typing import Optional, Dict, List, Tuple, Callable, AsyncIterator, Deque, Awaitable, Set, Any
+from collections import defaultdict, deque, OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from itertools import islice
 
+# Начало загрузки модуля (для замера времени холодного старта)
+MODULE_LOAD_STARTED = time.perf_counter()
+
+from aiohttp import web
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command
-from aiogram.types import Message
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, FSInputFile, ErrorEvent
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.base import BaseSession
+from aiogram.dispatcher.event.bases import UNHANDLED, SkipHandler, CancelHandler
 
 # Конфигурация из переменных окружения
 import os
@@ -29,10 +54,53 @@ BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 ADMIN_ID = int(os.getenv('ADMIN_ID', '0'))
 CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', '15'))
 DB_NAME = os.getenv('DB_NAME', 'darklook.db')
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')  # sqlite | memory
+DB_SNAPSHOT_PATH = os.getenv('DB_SNAPSHOT_PATH', '')
+DB_SNAPSHOT_INTERVAL = int(os.getenv('DB_SNAPSHOT_INTERVAL', '300'))
 MAX_TRACKED_USERS_PER_USER = int(os.getenv('MAX_TRACKED_USERS_PER_USER', '5'))
 COMMAND_COOLDOWN = int(os.getenv('COMMAND_COOLDOWN', '3'))
 RATE_LIMIT_MESSAGES = int(os.getenv('RATE_LIMIT_MESSAGES', '10'))
 RATE_LIMIT_PERIOD = int(os.getenv('RATE_LIMIT_PERIOD', '60'))
+MONITOR_LOAD_PAGE_SIZE = int(os.getenv('MONITOR_LOAD_PAGE_SIZE', '5000'))
+MONITOR_CHECKPOINT_EVERY = int(os.getenv('MONITOR_CHECKPOINT_EVERY', '100'))
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv('SUBSCRIPTION_CACHE_SIZE', '10000'))
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+EXPORT_MAX_FILE_SIZE = 50 * 1024 * 1024  # Лимит Bot API на отправку файлов
+QUARANTINE_MAX_DELAY = int(os.getenv('QUARANTINE_MAX_DELAY', '86400'))
+QUARANTINE_NOTIFY_AFTER = int(os.getenv('QUARANTINE_NOTIFY_AFTER', '3'))
+
+# Статистика обходов: сырые записи и агрегаты (минутные, часовые)
+SWEEP_STATS_RAW_RETENTION = int(os.getenv('SWEEP_STATS_RAW_RETENTION', '86400'))
+SWEEP_STATS_MINUTE_RETENTION = int(os.getenv('SWEEP_STATS_MINUTE_RETENTION', str(2 * 86400)))
+SWEEP_STATS_HOUR_RETENTION = int(os.getenv('SWEEP_STATS_HOUR_RETENTION', str(30 * 86400)))
+
+# Watchdog и health-check (Render передает порт web-сервиса в PORT)
+HEALTH_PORT = int(os.getenv('HEALTH_PORT', os.getenv('PORT', '0')))
+WATCHDOG_INTERVAL = float(os.getenv('WATCHDOG_INTERVAL', '1'))
+WATCHDOG_LAG_THRESHOLD = float(os.getenv('WATCHDOG_LAG_THRESHOLD', '0.5'))
+WATCHDOG_STALL_DUMP = int(os.getenv('WATCHDOG_STALL_DUMP', '30'))
+WATCHDOG_SWEEP_TIMEOUT = int(os.getenv('WATCHDOG_SWEEP_TIMEOUT', '600'))
+WATCHDOG_DUMP_INTERVAL = int(os.getenv('WATCHDOG_DUMP_INTERVAL', '60'))
+
+# Резервные копии базы
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_INTERVAL = int(os.getenv('BACKUP_INTERVAL', '0'))  # 0 - только по команде /backup
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '5'))
+BACKUP_MODE = os.getenv('BACKUP_MODE', 'backup')  # backup | vacuum
+BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', '256'))
+BACKUP_STEP_SLEEP = float(os.getenv('BACKUP_STEP_SLEEP', '0.01'))
+BACKUP_TIMEOUT = float(os.getenv('BACKUP_TIMEOUT', '600'))
+
+# Запись/воспроизведение трафика Bot API (для воспроизведения проблем производительности)
+BOT_API_RECORD = os.getenv('BOT_API_RECORD', '')  # путь к файлу записи (.jsonl или .jsonl.gz)
+BOT_API_REPLAY = os.getenv('BOT_API_REPLAY', '')  # путь к записи для воспроизведения
+BOT_API_REPLAY_SPEED = float(os.getenv('BOT_API_REPLAY_SPEED', '1'))  # множитель задержек, 0 - без задержек
+BOT_API_REPLAY_LOOP = os.getenv('BOT_API_REPLAY_LOOP', '1') == '1'
+
+# Обработка обновлений: общий лимит параллельности и лимит очереди
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+UPDATE_QUEUE_LIMIT = int(os.getenv('UPDATE_QUEUE_LIMIT', '1000'))
+UPDATE_USER_QUEUE_LIMIT = int(os.getenv('UPDATE_USER_QUEUE_LIMIT', '20'))
 
 # Telethon для поиска по username (опционально)
 TELETHON_API_ID = os.getenv('TELETHON_API_ID', '')
@@ -49,19 +117,299 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def open_recording(path: str, mode: str):
+    """Открытие файла записи (сжатого, если путь оканчивается на .gz)"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def recording_key(method) -> str:
+    """Ключ сопоставления запроса при воспроизведении (chat_id, если есть)"""
+    chat_id = getattr(method, 'chat_id', None)
+    return '' if chat_id is None else str(chat_id)
+
+
+_request_started: ContextVar[float] = ContextVar('_request_started', default=0.0)
+
+
+class RecordingSession(AiohttpSession):
+    """Сессия Bot API, записывающая запросы, сырые ответы и задержки
+    
+    Каждый запрос - одна JSON-строка: метод, ключ, параметры, задержка,
+    HTTP-статус и тело ответа. Запись содержит данные пользователей,
+    храните ее соответственно.
+    """
+    
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._file = open_recording(path, 'a')
+        self._origin = time.monotonic()
+    
+    def _write(self, method, started: float, status_code: int, content: Optional[str]):
+        try:
+            params = method.model_dump(mode='json', exclude_none=True)
+        except Exception:
+            params = {}
+        now = time.monotonic()
+        record = {
+            't': round(started - self._origin, 4),
+            'method': method.__api_method__,
+            'key': recording_key(method),
+            'params': params,
+            'latency': round(now - started, 4),
+            'status': status_code,
+            'content': content,
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    
+    async def make_request(self, bot: Bot, method, timeout: Optional[int] = None):
+        started = time.monotonic()
+        _request_started.set(started)
+        try:
+            return await super().make_request(bot, method, timeout)
+        except TelegramNetworkError:
+            self._write(method, started, 0, None)
+            raise
+    
+    def check_response(self, bot: Bot, method, status_code: int, content: str):
+        self._write(method, _request_started.get() or time.monotonic(), status_code, content)
+        return super().check_response(bot, method, status_code, content)
+    
+    async def close(self):
+        # AiohttpSession вызывает close() и при пересоздании соединения,
+        # поэтому здесь файл только сбрасывается на диск
+        await super().close()
+        if not self._file.closed:
+            self._file.flush()
+    
+    def finish(self):
+        """Закрытие файла записи при остановке бота"""
+        if not self._file.closed:
+            self._file.close()
+
+
+class ReplaySession(BaseSession):
+    """Сессия Bot API, отдающая ответы из записи RecordingSession
+    
+    Запросы сопоставляются по методу и ключу (chat_id); ответ для
+    другого chat_id никогда не подставляется - без записи для ключа
+    запрос завершается сетевой ошибкой. Ответ проходит через обычный
+    check_response, поэтому ошибки (flood wait, chat not found)
+    воспроизводятся как настоящие исключения. Задержка ответа равна
+    записанной, умноженной на speed. Файлы не записываются и
+    скачиваются обычной сессией.
+    """
+    
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self.speed = speed
+        self.loop = loop
+        self._by_key: Dict[Tuple[str, str], Deque[Dict]] = defaultdict(deque)
+        self._downloads: Optional[AiohttpSession] = None
+        
+        with open_recording(path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._by_key[(record['method'], record['key'])].append(record)
+        
+        methods = {method for method, _ in self._by_key}
+        logger.info(f"Загружена запись Bot API: {path}, методов: {len(methods)}")
+    
+    def _next_record(self, method) -> Optional[Dict]:
+        # Методы без chat_id записаны под ключом '' и берутся по порядку
+        queue = self._by_key.get((method.__api_method__, recording_key(method)))
+        if not queue:
+            return None
+        record = queue.popleft()
+        if self.loop:
+            queue.append(record)
+        return record
+    
+    async def make_request(self, bot: Bot, method, timeout: Optional[int] = None):
+        record = self._next_record(method)
+        if record is None:
+            raise TelegramNetworkError(method=method, message="Нет записи для воспроизведения")
+        
+        if self.speed > 0:
+            await asyncio.sleep(record['latency'] * self.speed)
+        
+        if record['content'] is None:
+            raise TelegramNetworkError(method=method, message="Записанная сетевая ошибка")
+        
+        response = self.check_response(
+            bot=bot, method=method, status_code=record['status'], content=record['content']
+        )
+        return response.result
+    
+    async def stream_content(self, url: str, headers: Optional[Dict] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True):
+        """Скачивание файла обычной сессией (содержимое файлов не записывается)"""
+        if self._downloads is None:
+            self._downloads = AiohttpSession()
+        async for chunk in self._downloads.stream_content(
+            url, headers=headers, timeout=timeout,
+            chunk_size=chunk_size, raise_for_status=raise_for_status
+        ):
+            yield chunk
+    
+    async def close(self):
+        if self._downloads is not None:
+            await self._downloads.close()
+
+
+def create_bot_session() -> Optional[BaseSession]:
+    """Сессия Bot API: воспроизведение, запись или обычная (None)"""
+    if BOT_API_REPLAY:
+        return ReplaySession(BOT_API_REPLAY, BOT_API_REPLAY_SPEED, BOT_API_REPLAY_LOOP)
+    if BOT_API_RECORD:
+        logger.info(f"Запись трафика Bot API в {BOT_API_RECORD}")
+        return RecordingSession(BOT_API_RECORD)
+    return None
+
+
+class UpdateExecutor:
+    """Исполнитель обновлений с общим лимитом и порядком для каждого пользователя
+    
+    Обновления одного пользователя выполняются строго по очереди, разных
+    пользователей - параллельно, но не более UPDATE_CONCURRENCY одновременно.
+    Если в очередях уже UPDATE_QUEUE_LIMIT обновлений, прием новых (polling)
+    ждет, поэтому память ограничена и при всплесках. Чтобы один пользователь
+    не занял весь общий лимит, сверх UPDATE_USER_QUEUE_LIMIT ожидающих
+    обновлений его новые обновления отбрасываются.
+    """
+    
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, queue_limit: int = UPDATE_QUEUE_LIMIT,
+                 user_queue_limit: int = UPDATE_USER_QUEUE_LIMIT):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._capacity = asyncio.Semaphore(queue_limit)
+        self._user_queue_limit = user_queue_limit
+        self._queues: Dict[Any, Deque[Callable[[], Awaitable]]] = {}
+        self._workers: Set[asyncio.Task] = set()
+        self.pending = 0
+        self.dropped = 0
+    
+    async def submit(self, key: Any, job: Callable[[], Awaitable]) -> bool:
+        """Постановка задачи в очередь пользователя key
+        
+        Возвращает False, если очередь пользователя заполнена и задача отброшена.
+        """
+        queue = self._queues.get(key)
+        if queue is not None and len(queue) >= self._user_queue_limit:
+            self.dropped += 1
+            logger.warning(f"Очередь пользователя {key} заполнена, обновление отброшено")
+            return False
+        
+        await self._capacity.acquire()
+        self.pending += 1
+        
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(job)
+            return True
+        
+        self._queues[key] = deque([job])
+        worker = asyncio.create_task(self._worker(key))
+        self._workers.add(worker)
+        worker.add_done_callback(self._workers.discard)
+        return True
+    
+    async def _worker(self, key: Any):
+        """Последовательная обработка очереди одного пользователя"""
+        queue = self._queues[key]
+        try:
+            while queue:
+                job = queue.popleft()
+                try:
+                    async with self._semaphore:
+                        await job()
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке обновления: {e}")
+                finally:
+                    self.pending -= 1
+                    self._capacity.release()
+        finally:
+            del self._queues[key]
+    
+    async def middleware(self, handler, event, data: Dict):
+        """Внешний middleware для dp.update: передает обновление в очередь
+        
+        Обработчик выполняется после возврата из middleware, то есть уже
+        вне ErrorsMiddleware aiogram, а его лог "Update is handled ...
+        Duration" измеряет только постановку в очередь. Поэтому исключения
+        обработчика передаются в dp.errors здесь, как это делает
+        ErrorsMiddleware.
+        """
+        user = data.get('event_from_user')
+        key = user.id if user else f"update:{event.update_id}"
+        
+        async def job():
+            try:
+                await handler(event, data)
+            except (SkipHandler, CancelHandler):
+                pass
+            except Exception as e:
+                response = await data['dispatcher'].propagate_event(
+                    update_type='error', event=ErrorEvent(update=event, exception=e), **data
+                )
+                if response is UNHANDLED:
+                    raise
+        
+        await self.submit(key, job)
+    
+    async def drain(self, timeout: float = 10):
+        """Ожидание обработки уже принятых обновлений при остановке"""
+        if self._workers:
+            await asyncio.wait(list(self._workers), timeout=timeout)
+
+
 # Инициализация бота
-bot = Bot(token=BOT_TOKEN)
+bot = Bot(token=BOT_TOKEN, session=create_bot_session())
 dp = Dispatcher()
+update_executor = UpdateExecutor()
+dp.update.outer_middleware(update_executor.middleware)
 
-# Telethon клиент (опционально)
+# Telethon клиент (опционально): импортируется и подключается в фоне при старте
 telethon_client = None
-if TELETHON_API_ID and TELETHON_API_HASH:
+_telethon_task: Optional[asyncio.Task] = None
+
+
+async def _start_telethon():
+    """Импорт Telethon (в отдельном потоке) и запуск клиента
+    
+    Идет в фоне после строки "Фазы старта", поэтому длительность этой
+    фазы (импорт и подключение) пишется в лог отдельно.
+    """
+    global telethon_client
+    started = time.perf_counter()
     try:
-        from telethon import TelegramClient
-        telethon_client = TelegramClient('darklook_session', int(TELETHON_API_ID), TELETHON_API_HASH)
-        logger.info("Telethon клиент инициализирован")
+        telethon = await asyncio.to_thread(importlib.import_module, 'telethon')
+        client = telethon.TelegramClient('darklook_session', int(TELETHON_API_ID), TELETHON_API_HASH)
+        await client.start()
+        telethon_client = client
+        logger.info(f"Telethon клиент запущен, фаза старта Telethon={time.perf_counter() - started:.3f}с")
     except Exception as e:
-        logger.warning(f"Telethon не доступен: {e}")
+        logger.warning(f"Не удалось запустить Telethon: {e}")
+    return telethon_client
+
+
+def start_telethon() -> Optional[asyncio.Task]:
+    """Фоновый запуск Telethon (однократно), если он настроен"""
+    global _telethon_task
+    if _telethon_task is None and TELETHON_API_ID and TELETHON_API_HASH:
+        _telethon_task = asyncio.create_task(_start_telethon())
+    return _telethon_task
+
+
+async def get_telethon_client():
+    """Telethon клиент, ожидающий завершения фонового запуска"""
+    task = start_telethon()
+    if task is None:
+        return None
+    return await asyncio.shield(task)
 
 # Rate limiting
 user_last_command = {}
@@ -99,15 +447,253 @@ class RateLimiter:
         return True
 
 
-class Database:
-    """Класс для работы с базой данных"""
+class BackupRestarted(Exception):
+    """Онлайн-копия SQLite начата заново из-за записи другим соединением"""
+
+
+class TrackLimitExceeded(Exception):
+    """Превышен лимит отслеживаемых пользователей"""
+    
+    def __init__(self, limit: int):
+        super().__init__(f"Достигнут лимит: {limit}")
+        self.limit = limit
+
+
+def sql_timestamp() -> str:
+    """Текущее время в формате CURRENT_TIMESTAMP SQLite (UTC)"""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+# Верхние границы корзин гистограммы длительности обхода (сек), последняя - без границы
+SWEEP_DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600, 1200, 1800, 3600)
+
+# Агрегаты статистики обходов: разрешение -> (ширина корзины, срок хранения), сек
+SWEEP_ROLLUPS = {
+    'minute': (60, SWEEP_STATS_MINUTE_RETENTION),
+    'hour': (3600, SWEEP_STATS_HOUR_RETENTION),
+}
+
+SWEEP_COUNTERS = ('targets', 'api_errors', 'flood_waits', 'changes')
+
+
+def new_rollup(resolution: str, bucket: int) -> Dict:
+    """Пустой агрегат обходов"""
+    rollup = {
+        'resolution': resolution,
+        'bucket': bucket,
+        'sweeps': 0,
+        'duration_sum': 0.0,
+        'duration_max': 0.0,
+        'histogram': [0] * (len(SWEEP_DURATION_BUCKETS) + 1),
+    }
+    for counter in SWEEP_COUNTERS:
+        rollup[counter] = 0
+    return rollup
+
+
+def add_sweep_to_rollup(rollup: Dict, sweep: Dict):
+    """Учет одного обхода в агрегате"""
+    rollup['sweeps'] += 1
+    rollup['duration_sum'] += sweep['duration']
+    rollup['duration_max'] = max(rollup['duration_max'], sweep['duration'])
+    rollup['histogram'][bisect_left(SWEEP_DURATION_BUCKETS, sweep['duration'])] += 1
+    for counter in SWEEP_COUNTERS:
+        rollup[counter] += sweep[counter]
+
+
+def merge_rollups(rollups: List[Dict]) -> Dict:
+    """Сложение агрегатов (гистограммы складываются по корзинам)"""
+    merged = new_rollup('', 0)
+    for rollup in rollups:
+        merged['sweeps'] += rollup['sweeps']
+        merged['duration_sum'] += rollup['duration_sum']
+        merged['duration_max'] = max(merged['duration_max'], rollup['duration_max'])
+        merged['histogram'] = [a + b for a, b in zip(merged['histogram'], rollup['histogram'])]
+        for counter in SWEEP_COUNTERS:
+            merged[counter] += rollup[counter]
+    return merged
+
+
+def histogram_percentile(histogram: List[int], q: float) -> Optional[float]:
+    """Верхняя граница корзины, в которую попадает q-квантиль (inf - за последней)"""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            return SWEEP_DURATION_BUCKETS[index] if index < len(SWEEP_DURATION_BUCKETS) else float('inf')
+    return float('inf')
+
+
+class Database(ABC):
+    """Интерфейс хранилища
+    
+    Обработчики и мониторинг работают только через эти методы,
+    конкретный движок выбирается в create_database().
+    """
+    
+    # Расширение файлов резервных копий
+    backup_extension = '.db'
+    
+    def __init__(self):
+        self._remove_listeners: List[Callable[[int, int], None]] = []
+    
+    def add_remove_listener(self, callback: Callable[[int, int], None]):
+        """Подписка на удаление отслеживания (owner_id, target_user_id)"""
+        self._remove_listeners.append(callback)
+    
+    def _notify_removed(self, owner_id: int, target_user_id: int):
+        for callback in self._remove_listeners:
+            callback(owner_id, target_user_id)
+    
+    @abstractmethod
+    async def init_db(self):
+        """Инициализация хранилища"""
+    
+    async def close(self):
+        """Освобождение ресурсов движка"""
+    
+    @abstractmethod
+    async def backup(self, dest_path: str, mode: str = 'backup'):
+        """Резервная копия хранилища в dest_path без остановки записи"""
+    
+    @abstractmethod
+    async def add_bot_user(self, user_id: int, username: str, first_name: str):
+        """Добавление пользователя бота"""
+    
+    @abstractmethod
+    async def log_action(self, user_id: int, action: str, details: str = ""):
+        """Логирование действий пользователей"""
+    
+    @abstractmethod
+    async def get_tracked_count(self, owner_id: int) -> int:
+        """Получение количества отслеживаемых пользователей"""
+    
+    @abstractmethod
+    async def add_tracked_user(self, owner_id: int, user_data: Dict, limit: int = 0) -> bool:
+        """Добавление пользователя для отслеживания
+        
+        Проверка лимита и вставка выполняются атомарно.
+        Если limit > 0 и он исчерпан, выбрасывается TrackLimitExceeded.
+        """
+    
+    @abstractmethod
+    async def remove_tracked_user(self, owner_id: int, target_user_id: int) -> bool:
+        """Удаление пользователя из отслеживания
+        
+        Когда у цели не остается владельцев, удаляются и ее расписание
+        и состояние карантина.
+        """
+    
+    @abstractmethod
+    async def get_tracked_users(self, owner_id: int = None) -> List[Dict]:
+        """Получение списка отслеживаемых пользователей"""
+    
+    @abstractmethod
+    async def get_tracked_rows_after(self, after_id: int, limit: int) -> List[Tuple]:
+        """Страница строк отслеживания с id > after_id (для мониторинга)
+        
+        Строка: (id, owner_id, target_user_id, username, first_name, last_name,
+        next_check_at, reason, failures, next_retry_at, notified) - расписание
+        и карантин цели (None, если записей нет).
+        """
+    
+    @abstractmethod
+    async def get_due_tracked_rows(self, now: float) -> List[Tuple]:
+        """Строки отслеживания (как в get_tracked_rows_after), цели которых пора проверять"""
+    
+    @abstractmethod
+    async def get_monitor_state(self, key: str) -> Optional[str]:
+        """Получение значения из состояния мониторинга"""
+    
+    @abstractmethod
+    async def save_target_failure(self, target_user_id: int, reason: str, failures: int,
+                                  next_retry_at: float, notified: bool):
+        """Сохранение состояния недоступной цели"""
+    
+    @abstractmethod
+    async def clear_target_failure(self, target_user_id: int):
+        """Сброс состояния цели после успешной проверки"""
+    
+    @abstractmethod
+    async def save_checkpoint(self, cursor_value: str, schedule: List[Tuple[int, float]]):
+        """Сохранение курсора обхода и расписания"""
+    
+    @abstractmethod
+    async def record_sweep(self, sweep: Dict):
+        """Запись обхода и обновление агрегатов с учетом сроков хранения
+        
+        sweep: {started_at, duration, targets, api_errors, flood_waits, changes}.
+        """
+    
+    @abstractmethod
+    async def get_sweep_rollups(self, resolution: str, since: float) -> List[Dict]:
+        """Агрегаты обходов разрешения resolution с корзинами не раньше since"""
+    
+    @abstractmethod
+    async def update_user_data(self, owner_id: int, target_user_id: int,
+                               field: str, new_value: str, old_value: str):
+        """Обновление данных и запись в историю"""
+    
+    @abstractmethod
+    def iter_change_history(self, owner_id: int,
+                            page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[List[Tuple]]:
+        """Постраничное чтение истории изменений владельца
+        
+        Строка: (changed_at, target_user_id, field_name, old_value, new_value).
+        """
+    
+    @abstractmethod
+    async def get_all_bot_users(self) -> List[Dict]:
+        """Получение всех пользователей бота (для админа)"""
+    
+    @abstractmethod
+    async def get_recent_actions(self, limit: int = 20) -> List[Dict]:
+        """Получение последних действий (для админа)"""
+
+
+class SQLiteDatabase(Database):
+    """Хранилище на SQLite (aiosqlite)"""
     
     def __init__(self, db_name: str):
+        super().__init__()
         self.db_name = db_name
+        # LRU-кэш подписок: owner_id -> {target_user_id: строка tracked_users}
+        self._subscriptions: 'OrderedDict[int, Dict[int, Dict]]' = OrderedDict()
+        # Блокировки владельцев: owner_id -> [Lock, число ожидающих]
+        self._owner_locks: Dict[int, List] = {}
+    
+    @asynccontextmanager
+    async def _owner_lock(self, owner_id: int):
+        """Блокировка владельца; удаляется, когда ее никто не ждет"""
+        entry = self._owner_locks.get(owner_id)
+        if entry is None:
+            entry = self._owner_locks[owner_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._owner_locks[owner_id]
+    
+    def _cached_owner(self, owner_id: int) -> Optional[Dict[int, Dict]]:
+        """Подписки владельца из кэша (с обновлением позиции в LRU)"""
+        cached = self._subscriptions.get(owner_id)
+        if cached is not None:
+            self._subscriptions.move_to_end(owner_id)
+        return cached
     
     async def init_db(self):
         """Инициализация базы данных"""
         async with aiosqlite.connect(self.db_name) as db:
+            # WAL: читатели (в том числе резервное копирование) не блокируют писателей
+            await db.execute("PRAGMA journal_mode=WAL")
+            
             # Таблица пользователей бота
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS bot_users (
@@ -158,6 +744,85 @@ class Database:
                 )
             """)
             
+            # Индекс для постраничной выгрузки истории владельца
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_change_history_owner
+                ON change_history (owner_id, id)
+            """)
+            
+            # Состояние мониторинга (курсор обхода и т.п.)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS monitor_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            
+            # Индекс для проверки, остались ли у цели владельцы
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_tracked_users_target
+                ON tracked_users (target_user_id)
+            """)
+            
+            # Время следующей проверки каждой цели (unix time)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS target_schedule (
+                    target_user_id INTEGER PRIMARY KEY,
+                    next_check_at REAL
+                )
+            """)
+            
+            # Недоступные цели (карантин с экспоненциальной задержкой)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS target_failures (
+                    target_user_id INTEGER PRIMARY KEY,
+                    reason TEXT,
+                    failures INTEGER,
+                    next_retry_at REAL,
+                    notified INTEGER DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            # Статистика обходов: сырые записи и агрегаты
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS sweep_stats (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started_at REAL,
+                    duration REAL,
+                    targets INTEGER,
+                    api_errors INTEGER,
+                    flood_waits INTEGER,
+                    changes INTEGER
+                )
+            """)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sweep_stats_started
+                ON sweep_stats (started_at)
+            """)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS sweep_rollups (
+                    resolution TEXT,
+                    bucket INTEGER,
+                    sweeps INTEGER,
+                    duration_sum REAL,
+                    duration_max REAL,
+                    targets INTEGER,
+                    api_errors INTEGER,
+                    flood_waits INTEGER,
+                    changes INTEGER,
+                    histogram TEXT,
+                    PRIMARY KEY (resolution, bucket)
+                )
+            """)
+            
+            # Расписание и карантин целей, у которых не осталось владельцев
+            for table in ('target_schedule', 'target_failures'):
+                await db.execute(f"""
+                    DELETE FROM {table} WHERE target_user_id NOT IN
+                    (SELECT target_user_id FROM tracked_users)
+                """)
+            
             await db.commit()
             logger.info("База данных инициализирована")
     
@@ -185,38 +850,160 @@ class Database:
         except Exception as e:
             logger.error(f"Ошибка при логировании: {e}")
     
-    async def get_tracked_count(self, owner_id: int) -> int:
-        """Получение количества отслеживаемых пользователей"""
+    async def backup(self, dest_path: str, mode: str = 'backup'):
+        """Резервная копия через online backup API или VACUUM INTO
+        
+        В режиме backup страницы копируются порциями по
+        BACKUP_PAGES_PER_STEP; после каждой порции progress-колбэк спит
+        BACKUP_STEP_SLEEP секунд (sqlite3 сам делает паузу только при
+        занятой базе). Запись в базу другим соединением начинает такую
+        копию заново, а бот пишет постоянно, поэтому при перезапуске
+        копия делается одним шагом - благодаря WAL он не блокирует
+        писателей. Режим vacuum - тоже одна читающая транзакция, зато
+        сжимает копию. Копирование идет в отдельном потоке и не блокирует
+        цикл событий; при отмене (таймаут) оно прерывается, и метод
+        возвращается только после закрытия обоих файлов.
+        """
+        stopped = threading.Event()
+        connections: List[sqlite3.Connection] = []
+        copy = asyncio.ensure_future(
+            asyncio.to_thread(self._copy_database, dest_path, mode, stopped, connections)
+        )
         try:
+            await asyncio.shield(copy)
+        except asyncio.CancelledError:
+            stopped.set()
+            for connection in connections:
+                connection.interrupt()
+            await asyncio.gather(copy, return_exceptions=True)
+            raise
+    
+    def _copy_database(self, dest_path: str, mode: str, stopped: threading.Event,
+                       connections: List[sqlite3.Connection]):
+        """Копирование базы (выполняется в отдельном потоке)"""
+        last_remaining = None
+        
+        def pause(status: int, remaining: int, total: int):
+            nonlocal last_remaining
+            if stopped.is_set():
+                raise InterruptedError("Резервное копирование прервано")
+            # Шаг не уменьшил остаток - копия начата заново
+            if last_remaining is not None and remaining >= last_remaining:
+                raise BackupRestarted()
+            last_remaining = remaining
+            if BACKUP_STEP_SLEEP > 0:
+                time.sleep(BACKUP_STEP_SLEEP)
+        
+        source = sqlite3.connect(self.db_name)
+        connections.append(source)
+        try:
+            if mode == 'vacuum':
+                source.execute("VACUUM INTO ?", (dest_path,))
+                return
+            
+            target = sqlite3.connect(dest_path)
+            try:
+                try:
+                    source.backup(target, pages=BACKUP_PAGES_PER_STEP,
+                                  progress=pause, sleep=BACKUP_STEP_SLEEP)
+                except BackupRestarted:
+                    logger.warning("Онлайн-копия перезапускается из-за записи в базу, копирование одним шагом")
+                    source.backup(target, pages=-1)
+                # Копия - самостоятельный файл, без -wal/-shm рядом
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+        finally:
+            source.close()
+    
+    async def _load_owner(self, owner_id: int) -> Dict[int, Dict]:
+        """Загрузка подписок владельца в кэш (один раз)"""
+        cached = self._cached_owner(owner_id)
+        if cached is not None:
+            return cached
+        
+        async with self._owner_lock(owner_id):
+            cached = self._cached_owner(owner_id)
+            if cached is not None:
+                return cached
+            
             async with aiosqlite.connect(self.db_name) as db:
+                db.row_factory = aiosqlite.Row
                 async with db.execute(
-                    "SELECT COUNT(*) FROM tracked_users WHERE owner_id = ?",
+                    "SELECT * FROM tracked_users WHERE owner_id = ?",
                     (owner_id,)
                 ) as cursor:
-                    result = await cursor.fetchone()
-                    return result[0] if result else 0
+                    rows = await cursor.fetchall()
+            
+            cached = {row['target_user_id']: dict(row) for row in rows}
+            self._subscriptions[owner_id] = cached
+            while len(self._subscriptions) > SUBSCRIPTION_CACHE_SIZE:
+                self._subscriptions.popitem(last=False)
+            return cached
+    
+    async def get_tracked_count(self, owner_id: int) -> int:
+        """Получение количества отслеживаемых пользователей"""
+        try:
+            return len(await self._load_owner(owner_id))
         except Exception as e:
             logger.error(f"Ошибка при подсчете: {e}")
             return 0
     
-    async def add_tracked_user(self, owner_id: int, user_data: Dict) -> bool:
-        """Добавление пользователя для отслеживания"""
+    async def add_tracked_user(self, owner_id: int, user_data: Dict, limit: int = 0) -> bool:
+        """Добавление пользователя для отслеживания
+        
+        Проверка лимита и вставка выполняются в одной транзакции.
+        Если limit > 0 и он исчерпан, выбрасывается TrackLimitExceeded.
+        """
         try:
-            async with aiosqlite.connect(self.db_name) as db:
-                await db.execute("""
-                    INSERT OR REPLACE INTO tracked_users 
-                    (owner_id, target_user_id, username, first_name, last_name, last_checked)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    owner_id,
-                    user_data['user_id'],
-                    user_data['username'],
-                    user_data['first_name'],
-                    user_data['last_name'],
-                    datetime.now().isoformat()
-                ))
-                await db.commit()
+            cached = await self._load_owner(owner_id)
+            target_user_id = user_data['user_id']
+            
+            async with self._owner_lock(owner_id):
+                if limit and target_user_id not in cached and len(cached) >= limit:
+                    raise TrackLimitExceeded(limit)
+                
+                async with aiosqlite.connect(self.db_name) as db:
+                    db.row_factory = aiosqlite.Row
+                    await db.execute("BEGIN IMMEDIATE")
+                    try:
+                        if limit:
+                            async with db.execute("""
+                                SELECT COUNT(*) FROM tracked_users
+                                WHERE owner_id = ? AND target_user_id != ?
+                            """, (owner_id, target_user_id)) as cursor:
+                                count = (await cursor.fetchone())[0]
+                            if count >= limit:
+                                raise TrackLimitExceeded(limit)
+                        
+                        await db.execute("""
+                            INSERT OR REPLACE INTO tracked_users 
+                            (owner_id, target_user_id, username, first_name, last_name, last_checked)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        """, (
+                            owner_id,
+                            target_user_id,
+                            user_data['username'],
+                            user_data['first_name'],
+                            user_data['last_name'],
+                            datetime.now().isoformat()
+                        ))
+                        
+                        async with db.execute(
+                            "SELECT * FROM tracked_users WHERE owner_id = ? AND target_user_id = ?",
+                            (owner_id, target_user_id)
+                        ) as cursor:
+                            row = await cursor.fetchone()
+                        
+                        await db.commit()
+                    except BaseException:
+                        await db.rollback()
+                        raise
+                
+                cached[target_user_id] = dict(row)
                 return True
+        except TrackLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при добавлении: {e}")
             return False
@@ -224,36 +1011,206 @@ class Database:
     async def remove_tracked_user(self, owner_id: int, target_user_id: int) -> bool:
         """Удаление пользователя из отслеживания"""
         try:
-            async with aiosqlite.connect(self.db_name) as db:
-                cursor = await db.execute(
-                    "DELETE FROM tracked_users WHERE owner_id = ? AND target_user_id = ?",
-                    (owner_id, target_user_id)
-                )
-                await db.commit()
-                return cursor.rowcount > 0
+            async with self._owner_lock(owner_id):
+                async with aiosqlite.connect(self.db_name) as db:
+                    cursor = await db.execute(
+                        "DELETE FROM tracked_users WHERE owner_id = ? AND target_user_id = ?",
+                        (owner_id, target_user_id)
+                    )
+                    if cursor.rowcount > 0:
+                        # Последний владелец: расписание и карантин цели больше не нужны
+                        for table in ('target_schedule', 'target_failures'):
+                            await db.execute(f"""
+                                DELETE FROM {table} WHERE target_user_id = ?
+                                AND NOT EXISTS (SELECT 1 FROM tracked_users WHERE target_user_id = ?)
+                            """, (target_user_id, target_user_id))
+                    await db.commit()
+                
+                cached = self._subscriptions.get(owner_id)
+                if cached is not None:
+                    cached.pop(target_user_id, None)
+                if cursor.rowcount <= 0:
+                    return False
+                self._notify_removed(owner_id, target_user_id)
+                return True
         except Exception as e:
             logger.error(f"Ошибка при удалении: {e}")
             return False
     
     async def get_tracked_users(self, owner_id: int = None) -> List[Dict]:
-        """Получение списка отслеживаемых пользователей"""
+        """Получение списка отслеживаемых пользователей
+        
+        Список конкретного владельца отдается из кэша, полный список
+        (для мониторинга и статистики) читается из базы.
+        """
         try:
+            if owner_id:
+                cached = await self._load_owner(owner_id)
+                return [dict(row) for row in cached.values()]
+            
             async with aiosqlite.connect(self.db_name) as db:
                 db.row_factory = aiosqlite.Row
-                if owner_id:
-                    query = "SELECT * FROM tracked_users WHERE owner_id = ?"
-                    params = (owner_id,)
-                else:
-                    query = "SELECT * FROM tracked_users"
-                    params = ()
-                
-                async with db.execute(query, params) as cursor:
+                async with db.execute("SELECT * FROM tracked_users") as cursor:
                     rows = await cursor.fetchall()
                     return [dict(row) for row in rows]
         except Exception as e:
             logger.error(f"Ошибка при получении списка: {e}")
             return []
     
+    # Строки мониторинга вместе с расписанием и карантином их целей
+    _MONITOR_ROWS_SQL = """
+        SELECT t.id, t.owner_id, t.target_user_id, t.username, t.first_name, t.last_name,
+               s.next_check_at, f.reason, f.failures, f.next_retry_at, f.notified
+        FROM tracked_users t
+        LEFT JOIN target_schedule s ON s.target_user_id = t.target_user_id
+        LEFT JOIN target_failures f ON f.target_user_id = t.target_user_id
+    """
+    
+    async def get_tracked_rows_after(self, after_id: int, limit: int) -> List[Tuple]:
+        """Страница строк tracked_users с id > after_id (для мониторинга)"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                async with db.execute(f"""
+                    {self._MONITOR_ROWS_SQL}
+                    WHERE t.id > ? ORDER BY t.id LIMIT ?
+                """, (after_id, limit)) as cursor:
+                    return await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке строк мониторинга: {e}")
+            return []
+    
+    async def get_due_tracked_rows(self, now: float) -> List[Tuple]:
+        """Строки tracked_users, цели которых пора проверять"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                async with db.execute(f"""
+                    {self._MONITOR_ROWS_SQL}
+                    WHERE s.next_check_at IS NULL OR s.next_check_at <= ?
+                    ORDER BY t.id
+                """, (now,)) as cursor:
+                    return await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке целей к проверке: {e}")
+            return []
+    
+    async def get_monitor_state(self, key: str) -> Optional[str]:
+        """Получение значения из состояния мониторинга"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                async with db.execute(
+                    "SELECT value FROM monitor_state WHERE key = ?", (key,)
+                ) as cursor:
+                    row = await cursor.fetchone()
+                    return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Ошибка при чтении состояния мониторинга: {e}")
+            return None
+    
+    async def save_target_failure(self, target_user_id: int, reason: str, failures: int,
+                                  next_retry_at: float, notified: bool):
+        """Сохранение состояния недоступной цели"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                await db.execute("""
+                    INSERT OR REPLACE INTO target_failures
+                    (target_user_id, reason, failures, next_retry_at, notified, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (target_user_id, reason, failures, next_retry_at, int(notified), sql_timestamp()))
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении недоступной цели: {e}")
+    
+    async def clear_target_failure(self, target_user_id: int):
+        """Сброс состояния цели после успешной проверки"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                await db.execute(
+                    "DELETE FROM target_failures WHERE target_user_id = ?", (target_user_id,)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при сбросе недоступной цели: {e}")
+    
+    async def save_checkpoint(self, cursor_value: str, schedule: List[Tuple[int, float]]):
+        """Сохранение курсора обхода и расписания одной транзакцией"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                await db.executemany(
+                    "INSERT OR REPLACE INTO target_schedule (target_user_id, next_check_at) VALUES (?, ?)",
+                    schedule
+                )
+                await db.execute(
+                    "INSERT OR REPLACE INTO monitor_state (key, value) VALUES ('sweep_cursor', ?)",
+                    (cursor_value,)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении чекпоинта: {e}")
+    
+    @staticmethod
+    def _rollup_from_row(row) -> Dict:
+        rollup = dict(row)
+        rollup['histogram'] = json.loads(rollup['histogram'])
+        return rollup
+    
+    async def record_sweep(self, sweep: Dict):
+        """Запись обхода и обновление агрегатов одной транзакцией"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                db.row_factory = aiosqlite.Row
+                await db.execute("BEGIN IMMEDIATE")
+                await db.execute("""
+                    INSERT INTO sweep_stats
+                    (started_at, duration, targets, api_errors, flood_waits, changes)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (sweep['started_at'], sweep['duration'], sweep['targets'],
+                      sweep['api_errors'], sweep['flood_waits'], sweep['changes']))
+                await db.execute(
+                    "DELETE FROM sweep_stats WHERE started_at < ?",
+                    (sweep['started_at'] - SWEEP_STATS_RAW_RETENTION,)
+                )
+                
+                for resolution, (width, retention) in SWEEP_ROLLUPS.items():
+                    bucket = int(sweep['started_at'] // width * width)
+                    async with db.execute(
+                        "SELECT * FROM sweep_rollups WHERE resolution = ? AND bucket = ?",
+                        (resolution, bucket)
+                    ) as cursor:
+                        row = await cursor.fetchone()
+                    
+                    rollup = self._rollup_from_row(row) if row else new_rollup(resolution, bucket)
+                    add_sweep_to_rollup(rollup, sweep)
+                    await db.execute("""
+                        INSERT OR REPLACE INTO sweep_rollups
+                        (resolution, bucket, sweeps, duration_sum, duration_max,
+                         targets, api_errors, flood_waits, changes, histogram)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (resolution, bucket, rollup['sweeps'], rollup['duration_sum'],
+                          rollup['duration_max'], rollup['targets'], rollup['api_errors'],
+                          rollup['flood_waits'], rollup['changes'], json.dumps(rollup['histogram'])))
+                    await db.execute(
+                        "DELETE FROM sweep_rollups WHERE resolution = ? AND bucket < ?",
+                        (resolution, sweep['started_at'] - retention)
+                    )
+                
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при записи статистики обхода: {e}")
+    
+    async def get_sweep_rollups(self, resolution: str, since: float) -> List[Dict]:
+        """Агрегаты обходов разрешения resolution с корзинами не раньше since"""
+        try:
+            async with aiosqlite.connect(self.db_name) as db:
+                db.row_factory = aiosqlite.Row
+                async with db.execute(
+                    "SELECT * FROM sweep_rollups WHERE resolution = ? AND bucket >= ? ORDER BY bucket",
+                    (resolution, since)
+                ) as cursor:
+                    return [self._rollup_from_row(row) for row in await cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка при получении статистики обходов: {e}")
+            return []
+    
     async def update_user_data(self, owner_id: int, target_user_id: int, 
                               field: str, new_value: str, old_value: str):
         """Обновление данных и запись в историю"""
@@ -270,9 +1227,40 @@ class Database:
                 """, (owner_id, target_user_id, field, old_value, new_value))
                 
                 await db.commit()
+            
+            cached = self._subscriptions.get(owner_id)
+            if cached is not None and target_user_id in cached:
+                cached[target_user_id][field] = new_value
         except Exception as e:
             logger.error(f"Ошибка при обновлении: {e}")
     
+    async def iter_change_history(self, owner_id: int,
+                                  page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[List[Tuple]]:
+        """Постраничное чтение истории изменений владельца
+        
+        Каждая страница читается в отдельном коротком соединении,
+        поэтому выгрузка не держит базу между страницами.
+        """
+        last_id = 0
+        while True:
+            async with aiosqlite.connect(self.db_name) as db:
+                async with db.execute("""
+                    SELECT id, changed_at, target_user_id, field_name, old_value, new_value
+                    FROM change_history
+                    WHERE owner_id = ? AND id > ?
+                    ORDER BY id LIMIT ?
+                """, (owner_id, last_id, page_size)) as cursor:
+                    rows = await cursor.fetchall()
+            
+            if not rows:
+                return
+            
+            last_id = rows[-1][0]
+            yield [row[1:] for row in rows]
+            
+            if len(rows) < page_size:
+                return
+    
     async def get_all_bot_users(self) -> List[Dict]:
         """Получение всех пользователей бота (для админа)"""
         try:
@@ -301,6 +1289,448 @@ class Database:
             return []
 
 
+class MemoryDatabase(Database):
+    """Хранилище в памяти с опциональными снимками на диск
+    
+    Все операции выполняются в цикле событий без ожиданий, поэтому
+    атомарны. Если задан snapshot_path, состояние периодически
+    сохраняется в JSON-файл и загружается из него при старте.
+    """
+    
+    backup_extension = '.json'
+    
+    def __init__(self, snapshot_path: str = '', snapshot_interval: int = DB_SNAPSHOT_INTERVAL):
+        super().__init__()
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_task: Optional[asyncio.Task] = None
+        
+        self.bot_users: Dict[int, Dict] = {}
+        self.tracked: Dict[int, Dict] = {}                  # id -> строка
+        self._tracked_index: Dict[int, Dict[int, int]] = {}  # owner_id -> {target_user_id: id}
+        self._target_owners: Dict[int, int] = {}            # target_user_id -> число владельцев
+        self.history: Dict[int, List[Tuple]] = {}           # owner_id -> [(id, changed_at, ...)]
+        self.action_logs: List[Dict] = []
+        self.monitor_state: Dict[str, str] = {}
+        self.target_schedule: Dict[int, float] = {}
+        self.target_failures: Dict[int, Dict] = {}
+        self.sweep_stats: Deque[Dict] = deque()
+        self.sweep_rollups: Dict[Tuple[str, int], Dict] = {}
+        self._next_ids = {'tracked': 0, 'history': 0, 'action': 0}
+    
+    def _next_id(self, table: str) -> int:
+        self._next_ids[table] += 1
+        return self._next_ids[table]
+    
+    async def init_db(self):
+        """Загрузка снимка и запуск периодического сохранения"""
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            try:
+                snapshot = await asyncio.to_thread(self._read_snapshot)
+                self._restore(snapshot)
+                logger.info(f"Снимок хранилища загружен: {self.snapshot_path}")
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке снимка: {e}")
+        
+        if self.snapshot_path and self.snapshot_interval > 0:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+        
+        logger.info("Хранилище в памяти инициализировано")
+    
+    async def close(self):
+        """Остановка снимков и сохранение финального состояния"""
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        if self.snapshot_path:
+            await self.save_snapshot()
+    
+    def _read_snapshot(self) -> Dict:
+        with open(self.snapshot_path, encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _restore(self, snapshot: Dict):
+        self.bot_users = {row['user_id']: row for row in snapshot['bot_users']}
+        self.tracked = {row['id']: row for row in snapshot['tracked_users']}
+        self._tracked_index = {}
+        self._target_owners = {}
+        for row in self.tracked.values():
+            self._tracked_index.setdefault(row['owner_id'], {})[row['target_user_id']] = row['id']
+            self._target_owners[row['target_user_id']] = self._target_owners.get(row['target_user_id'], 0) + 1
+        self.history = {}
+        for row in snapshot['change_history']:
+            self.history.setdefault(row[1], []).append((row[0],) + tuple(row[2:]))
+        self.action_logs = snapshot['action_logs']
+        self.monitor_state = snapshot['monitor_state']
+        self.target_schedule = {int(k): v for k, v in snapshot['target_schedule'].items()}
+        self.target_failures = {int(k): v for k, v in snapshot.get('target_failures', {}).items()}
+        self.sweep_stats = deque(snapshot.get('sweep_stats', []))
+        self.sweep_rollups = {
+            (rollup['resolution'], rollup['bucket']): rollup
+            for rollup in snapshot.get('sweep_rollups', [])
+        }
+        self._next_ids = snapshot['next_ids']
+    
+    async def backup(self, dest_path: str, mode: str = 'backup'):
+        """Резервная копия - снимок состояния в dest_path"""
+        await self.save_snapshot(dest_path)
+    
+    async def save_snapshot(self, path: str = ''):
+        """Атомарное сохранение снимка (запись файла вне цикла событий)"""
+        snapshot = {
+            'bot_users': [dict(row) for row in self.bot_users.values()],
+            'tracked_users': [dict(row) for row in self.tracked.values()],
+            'change_history': [
+                (row[0], owner_id) + row[1:]
+                for owner_id, rows in self.history.items() for row in rows
+            ],
+            'action_logs': list(self.action_logs),
+            'monitor_state': dict(self.monitor_state),
+            'target_schedule': dict(self.target_schedule),
+            'target_failures': {k: dict(v) for k, v in self.target_failures.items()},
+            'sweep_stats': list(self.sweep_stats),
+            'sweep_rollups': [
+                dict(rollup, histogram=list(rollup['histogram']))
+                for rollup in self.sweep_rollups.values()
+            ],
+            'next_ids': dict(self._next_ids),
+        }
+        try:
+            await asyncio.to_thread(self._write_snapshot, snapshot, path or self.snapshot_path)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении снимка: {e}")
+    
+    @staticmethod
+    def _write_snapshot(snapshot: Dict, path: str):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            await self.save_snapshot()
+    
+    async def add_bot_user(self, user_id: int, username: str, first_name: str):
+        now = sql_timestamp()
+        self.bot_users[user_id] = {
+            'user_id': user_id,
+            'username': username,
+            'first_name': first_name,
+            'started_at': now,
+            'last_activity': datetime.now().isoformat(),
+        }
+    
+    async def log_action(self, user_id: int, action: str, details: str = ""):
+        self.action_logs.append({
+            'id': self._next_id('action'),
+            'user_id': user_id,
+            'action': action,
+            'details': details,
+            'created_at': sql_timestamp(),
+        })
+    
+    async def get_tracked_count(self, owner_id: int) -> int:
+        return len(self._tracked_index.get(owner_id, ()))
+    
+    async def add_tracked_user(self, owner_id: int, user_data: Dict, limit: int = 0) -> bool:
+        owned = self._tracked_index.setdefault(owner_id, {})
+        target_user_id = user_data['user_id']
+        
+        if limit and target_user_id not in owned and len(owned) >= limit:
+            raise TrackLimitExceeded(limit)
+        
+        # Как INSERT OR REPLACE: старая строка удаляется, новая получает новый id
+        old_id = owned.pop(target_user_id, None)
+        if old_id is not None:
+            del self.tracked[old_id]
+        else:
+            self._target_owners[target_user_id] = self._target_owners.get(target_user_id, 0) + 1
+        
+        row_id = self._next_id('tracked')
+        self.tracked[row_id] = {
+            'id': row_id,
+            'owner_id': owner_id,
+            'target_user_id': target_user_id,
+            'username': user_data['username'],
+            'first_name': user_data['first_name'],
+            'last_name': user_data['last_name'],
+            'added_at': sql_timestamp(),
+            'last_checked': datetime.now().isoformat(),
+        }
+        owned[target_user_id] = row_id
+        return True
+    
+    async def remove_tracked_user(self, owner_id: int, target_user_id: int) -> bool:
+        owned = self._tracked_index.get(owner_id, {})
+        row_id = owned.pop(target_user_id, None)
+        if row_id is None:
+            return False
+        if not owned:
+            del self._tracked_index[owner_id]
+        del self.tracked[row_id]
+        self._target_owners[target_user_id] -= 1
+        if not self._target_owners[target_user_id]:
+            del self._target_owners[target_user_id]
+            self.target_schedule.pop(target_user_id, None)
+            self.target_failures.pop(target_user_id, None)
+        self._notify_removed(owner_id, target_user_id)
+        return True
+    
+    async def get_tracked_users(self, owner_id: int = None) -> List[Dict]:
+        if owner_id:
+            return [dict(self.tracked[row_id])
+                    for row_id in self._tracked_index.get(owner_id, {}).values()]
+        return [dict(row) for row in self.tracked.values()]
+    
+    def _monitor_row(self, row: Dict) -> Tuple:
+        target_user_id = row['target_user_id']
+        failure = self.target_failures.get(target_user_id)
+        state = ((failure['reason'], failure['failures'], failure['next_retry_at'], failure['notified'])
+                 if failure else (None, None, None, None))
+        return (row['id'], row['owner_id'], target_user_id,
+                row['username'], row['first_name'], row['last_name'],
+                self.target_schedule.get(target_user_id)) + state
+    
+    # id только растут, а словарь хранит порядок вставки, поэтому
+    # self.tracked всегда упорядочен по id
+    async def get_tracked_rows_after(self, after_id: int, limit: int) -> List[Tuple]:
+        rows = (row for row in self.tracked.values() if row['id'] > after_id)
+        return [self._monitor_row(row) for row in islice(rows, limit)]
+    
+    async def get_due_tracked_rows(self, now: float) -> List[Tuple]:
+        return [
+            self._monitor_row(row) for row in self.tracked.values()
+            if self.target_schedule.get(row['target_user_id'], 0) <= now
+        ]
+    
+    async def get_monitor_state(self, key: str) -> Optional[str]:
+        return self.monitor_state.get(key)
+    
+    async def save_target_failure(self, target_user_id: int, reason: str, failures: int,
+                                  next_retry_at: float, notified: bool):
+        self.target_failures[target_user_id] = {
+            'reason': reason,
+            'failures': failures,
+            'next_retry_at': next_retry_at,
+            'notified': notified,
+        }
+    
+    async def clear_target_failure(self, target_user_id: int):
+        self.target_failures.pop(target_user_id, None)
+    
+    async def save_checkpoint(self, cursor_value: str, schedule: List[Tuple[int, float]]):
+        self.target_schedule.update(schedule)
+        self.monitor_state['sweep_cursor'] = cursor_value
+    
+    async def record_sweep(self, sweep: Dict):
+        self.sweep_stats.append(dict(sweep))
+        while self.sweep_stats[0]['started_at'] < sweep['started_at'] - SWEEP_STATS_RAW_RETENTION:
+            self.sweep_stats.popleft()
+        
+        for resolution, (width, retention) in SWEEP_ROLLUPS.items():
+            bucket = int(sweep['started_at'] // width * width)
+            rollup = self.sweep_rollups.get((resolution, bucket))
+            if rollup is None:
+                rollup = self.sweep_rollups[(resolution, bucket)] = new_rollup(resolution, bucket)
+                # Новая корзина - удобный момент удалить устаревшие
+                for key in [key for key in self.sweep_rollups
+                            if key[0] == resolution and key[1] < sweep['started_at'] - retention]:
+                    del self.sweep_rollups[key]
+            add_sweep_to_rollup(rollup, sweep)
+    
+    async def get_sweep_rollups(self, resolution: str, since: float) -> List[Dict]:
+        return sorted(
+            (dict(rollup, histogram=list(rollup['histogram']))
+             for (res, bucket), rollup in self.sweep_rollups.items()
+             if res == resolution and bucket >= since),
+            key=lambda rollup: rollup['bucket']
+        )
+    
+    async def update_user_data(self, owner_id: int, target_user_id: int,
+                               field: str, new_value: str, old_value: str):
+        row_id = self._tracked_index.get(owner_id, {}).get(target_user_id)
+        if row_id is not None:
+            row = self.tracked[row_id]
+            row[field] = new_value
+            row['last_checked'] = datetime.now().isoformat()
+        
+        self.history.setdefault(owner_id, []).append((
+            self._next_id('history'), sql_timestamp(),
+            target_user_id, field, old_value, new_value
+        ))
+    
+    async def iter_change_history(self, owner_id: int,
+                                  page_size: int = EXPORT_PAGE_SIZE) -> AsyncIterator[List[Tuple]]:
+        rows = self.history.get(owner_id, [])
+        position = 0
+        while position < len(rows):
+            page = rows[position:position + page_size]
+            position += len(page)
+            yield [row[1:] for row in page]
+    
+    async def get_all_bot_users(self) -> List[Dict]:
+        return sorted((dict(row) for row in self.bot_users.values()),
+                      key=lambda row: row['started_at'], reverse=True)
+    
+    async def get_recent_actions(self, limit: int = 20) -> List[Dict]:
+        return [dict(row) for row in reversed(self.action_logs[-limit:])]
+
+
+def create_database() -> Database:
+    """Создание хранилища по DB_ENGINE
+    
+    При воспроизведении записи Bot API ответы не настоящие, поэтому
+    используется только хранилище в памяти без снимков.
+    """
+    if BOT_API_REPLAY:
+        logger.warning("Воспроизведение Bot API: используется хранилище в памяти без снимков")
+        return MemoryDatabase()
+    if DB_ENGINE == 'memory':
+        return MemoryDatabase(DB_SNAPSHOT_PATH, DB_SNAPSHOT_INTERVAL)
+    if DB_ENGINE != 'sqlite':
+        logger.warning(f"Неизвестный DB_ENGINE={DB_ENGINE}, используется sqlite")
+    return SQLiteDatabase(DB_NAME)
+
+
+# Отслеживаемые поля профиля и их отображаемые названия
+TRACKED_FIELDS = (
+    ('username', 'Юзернейм'),
+    ('first_name', 'Имя'),
+    ('last_name', 'Фамилия'),
+)
+
+
+def profile_fingerprint(username: str, first_name: str, last_name: str) -> int:
+    """Отпечаток профиля: совпадение означает, что поля не менялись"""
+    return hash((username, first_name, last_name))
+
+
+class TargetTable:
+    """Таблица отслеживаний в памяти, сгруппированная по целям
+    
+    Для каждой строки хранятся только владелец и отпечаток профиля - в
+    параллельных массивах; записи одной цели связаны в цепочку через
+    _next, словарь _heads ведет от цели к первой записи. Сами поля
+    профиля остаются в базе и читаются лишь при несовпадении отпечатка.
+    
+    Строки подгружаются из базы порциями по возрастанию id, поэтому
+    каждая загрузка читает только новые (или пересозданные) строки.
+    """
+    
+    def __init__(self):
+        self._owner = array('q')
+        self._fingerprint = array('q')
+        self._next = array('q')
+        self._heads: Dict[int, int] = {}
+        self._free = array('q')
+        self.max_row_id = 0
+    
+    def __len__(self) -> int:
+        return len(self._owner) - len(self._free)
+    
+    def _find(self, owner_id: int, target_user_id: int) -> int:
+        slot = self._heads.get(target_user_id, -1)
+        while slot >= 0 and self._owner[slot] != owner_id:
+            slot = self._next[slot]
+        return slot
+    
+    def upsert(self, row_id: int, owner_id: int, target_user_id: int,
+               username: str, first_name: str, last_name: str,
+               advance: bool = True):
+        """Добавление или замена записи (owner_id, target_user_id)
+        
+        advance=False не сдвигает max_row_id: так загружаются выборочные
+        строки, которые позже будут перечитаны полной загрузкой.
+        """
+        fingerprint = profile_fingerprint(username or '', first_name or '', last_name or '')
+        slot = self._find(owner_id, target_user_id)
+        if slot >= 0:
+            self._fingerprint[slot] = fingerprint
+        else:
+            head = self._heads.get(target_user_id, -1)
+            if self._free:
+                slot = self._free.pop()
+                self._owner[slot] = owner_id
+                self._fingerprint[slot] = fingerprint
+                self._next[slot] = head
+            else:
+                slot = len(self._owner)
+                self._owner.append(owner_id)
+                self._fingerprint.append(fingerprint)
+                self._next.append(head)
+            self._heads[target_user_id] = slot
+        if advance and row_id > self.max_row_id:
+            self.max_row_id = row_id
+    
+    def discard(self, owner_id: int, target_user_id: int):
+        """Удаление записи, если она есть"""
+        prev = -1
+        slot = self._heads.get(target_user_id, -1)
+        while slot >= 0 and self._owner[slot] != owner_id:
+            prev, slot = slot, self._next[slot]
+        if slot < 0:
+            return
+        if prev >= 0:
+            self._next[prev] = self._next[slot]
+        elif self._next[slot] >= 0:
+            self._heads[target_user_id] = self._next[slot]
+        else:
+            del self._heads[target_user_id]
+        self._free.append(slot)
+    
+    def set_fingerprint(self, owner_id: int, target_user_id: int, fingerprint: int):
+        """Обновление отпечатка после проверки"""
+        slot = self._find(owner_id, target_user_id)
+        if slot >= 0:
+            self._fingerprint[slot] = fingerprint
+    
+    def target_ids(self) -> List[int]:
+        """Уникальные ID целей"""
+        return list(self._heads)
+    
+    def owners_for(self, target_user_id: int) -> List[Tuple[int, int]]:
+        """(owner_id, отпечаток) всех владельцев, отслеживающих цель"""
+        owners = []
+        slot = self._heads.get(target_user_id, -1)
+        while slot >= 0:
+            owners.append((self._owner[slot], self._fingerprint[slot]))
+            slot = self._next[slot]
+        return owners
+    
+    def _absorb(self, rows: List[Tuple], schedule: Dict[int, float],
+                failures: Dict[int, Dict], advance: bool = True):
+        """Загрузка строк мониторинга; расписание и карантин их целей
+        дополняют schedule и failures (значения в памяти не перезаписываются)"""
+        for row in rows:
+            self.upsert(*row[:6], advance=advance)
+            target_user_id, next_check_at, reason = row[2], row[6], row[7]
+            if next_check_at is not None:
+                schedule.setdefault(target_user_id, next_check_at)
+            if reason is not None:
+                failures.setdefault(target_user_id, {
+                    'reason': reason,
+                    'failures': row[8],
+                    'next_retry_at': row[9],
+                    'notified': bool(row[10]),
+                })
+    
+    async def load(self, db: 'Database', schedule: Dict[int, float], failures: Dict[int, Dict],
+                   page_size: int = MONITOR_LOAD_PAGE_SIZE):
+        """Подгрузка новых строк из базы"""
+        while True:
+            rows = await db.get_tracked_rows_after(self.max_row_id, page_size)
+            self._absorb(rows, schedule, failures)
+            if len(rows) < page_size:
+                break
+    
+    async def load_due(self, db: 'Database', now: float,
+                       schedule: Dict[int, float], failures: Dict[int, Dict]):
+        """Загрузка только тех целей, которые пора проверять (холодный старт)"""
+        self._absorb(await db.get_due_tracked_rows(now), schedule, failures, advance=False)
+
+
 class UserMonitor:
     """Класс для мониторинга изменений"""
     
@@ -308,18 +1738,47 @@ class UserMonitor:
         self.bot = bot
         self.db = db
         self.monitoring = False
+        self.targets = TargetTable()
+        db.add_remove_listener(self._on_removed)
+        # Курсор обхода: последний проверенный target_user_id текущего обхода
+        self.sweep_cursor: Optional[int] = None
+        # Время следующей проверки цели и еще не сохраненные записи расписания
+        self.next_check_at: Dict[int, float] = {}
+        self._dirty_schedule: Dict[int, float] = {}
+        self._restored = False
+        # Недоступные цели: target_user_id -> {reason, failures, next_retry_at, notified}
+        self.failures: Dict[int, Dict] = {}
+        # Для watchdog: время последней проверенной цели, время завершения
+        # и длительность последнего обхода
+        self.started_at = time.time()
+        self.last_progress_at: Optional[float] = None
+        self.last_sweep_at: Optional[float] = None
+        self.last_sweep_duration = 0.0
+        self.last_error = ''
+    
+    def _on_removed(self, owner_id: int, target_user_id: int):
+        """Удаление отслеживания; у цели без владельцев забывается расписание"""
+        self.targets.discard(owner_id, target_user_id)
+        if not self.targets.owners_for(target_user_id):
+            self.next_check_at.pop(target_user_id, None)
+            self._dirty_schedule.pop(target_user_id, None)
+            self.failures.pop(target_user_id, None)
+    
+    async def fetch_user_info(self, user_id: int) -> Dict:
+        """Получение информации о пользователе через Bot API (без перехвата ошибок)"""
+        chat = await self.bot.get_chat(user_id)
+        
+        return {
+            'user_id': chat.id,
+            'username': chat.username or '',
+            'first_name': chat.first_name or '',
+            'last_name': chat.last_name or '',
+        }
     
     async def get_user_info(self, user_id: int) -> Optional[Dict]:
         """Получение информации о пользователе через Bot API"""
         try:
-            chat = await self.bot.get_chat(user_id)
-            
-            return {
-                'user_id': chat.id,
-                'username': chat.username or '',
-                'first_name': chat.first_name or '',
-                'last_name': chat.last_name or '',
-            }
+            return await self.fetch_user_info(user_id)
         except TelegramBadRequest as e:
             logger.warning(f"Пользователь {user_id} недоступен: {e}")
             return None
@@ -342,12 +1801,13 @@ class UserMonitor:
             logger.info(f"Bot API не смог найти @{username}: {e}")
         
         # Если Bot API не сработал, пробуем через Telethon
-        if telethon_client:
+        client = await get_telethon_client()
+        if client:
             try:
-                if not telethon_client.is_connected():
-                    await telethon_client.connect()
+                if not client.is_connected():
+                    await client.connect()
                 
-                user = await telethon_client.get_entity(username)
+                user = await client.get_entity(username)
                 return {
                     'user_id': user.id,
                     'username': user.username or '',
@@ -359,49 +1819,188 @@ class UserMonitor:
         
         return None
     
+    async def get_stored_profile(self, owner_id: int, target_user_id: int) -> Optional[Dict]:
+        """Сохраненные у владельца поля профиля цели (из базы)"""
+        for row in await self.db.get_tracked_users(owner_id):
+            if row['target_user_id'] == target_user_id:
+                return row
+        return None
+    
+    async def restore_checkpoint(self):
+        """Восстановление курсора и расписания после перезапуска
+        
+        Загружаются только цели, которые пора проверять (вместе с их
+        расписанием и карантином); остальные строки подтянутся полной
+        загрузкой на следующем обходе.
+        """
+        cursor_value = await self.db.get_monitor_state('sweep_cursor')
+        self.sweep_cursor = int(cursor_value) if cursor_value else None
+        await self.targets.load_due(self.db, time.time(), self.next_check_at, self.failures)
+        self._restored = True
+        logger.info(
+            f"Чекпоинт мониторинга восстановлен: курсор={self.sweep_cursor}, "
+            f"к проверке {len(self.targets)} строк"
+        )
+    
+    async def save_checkpoint(self):
+        """Сохранение курсора и накопленного расписания"""
+        schedule = list(self._dirty_schedule.items())
+        self._dirty_schedule.clear()
+        cursor_value = '' if self.sweep_cursor is None else str(self.sweep_cursor)
+        await self.db.save_checkpoint(cursor_value, schedule)
+    
+    def _sweep_order(self) -> List[int]:
+        """Цели в порядке обхода, начиная после сохраненного курсора"""
+        target_ids = sorted(self.targets.target_ids())
+        if self.sweep_cursor is None:
+            return target_ids
+        start = bisect_right(target_ids, self.sweep_cursor)
+        return target_ids[start:]
+    
     async def check_changes(self):
         """Проверка изменений у всех отслеживаемых"""
-        users = await self.db.get_tracked_users()
+        if self._restored:
+            # Первый обход после старта работает только с целями к проверке
+            self._restored = False
+        else:
+            await self.targets.load(self.db, self.next_check_at, self.failures)
         
-        for user in users:
+        checked = 0
+        sweep_started = time.time()
+        sweep = {'api_errors': 0, 'flood_waits': 0, 'changes': 0}
+        
+        # Один запрос к API на цель, даже если ее отслеживают несколько владельцев
+        for target_user_id in self._sweep_order():
+            if self.next_check_at.get(target_user_id, 0) > time.time():
+                continue
+            
+            next_check_at = time.time() + CHECK_INTERVAL
             try:
-                current_info = await self.get_user_info(user['target_user_id'])
-                
-                if not current_info:
-                    continue
-                
-                changes = []
-                fields_map = {
-                    'username': 'Юзернейм',
-                    'first_name': 'Имя',
-                    'last_name': 'Фамилия'
-                }
-                
-                for field, display_name in fields_map.items():
-                    old_value = user[field] or ''
-                    new_value = current_info[field] or ''
-                    
-                    if old_value != new_value:
-                        changes.append({
-                            'field': field,
-                            'display_name': display_name,
-                            'old': old_value,
-                            'new': new_value
-                        })
-                        
-                        await self.db.update_user_data(
-                            user['owner_id'],
-                            user['target_user_id'],
-                            field,
-                            new_value,
-                            old_value
-                        )
-                
-                if changes:
-                    await self.send_change_notification(user['owner_id'], current_info['username'], changes)
-                
+                sweep['changes'] += await self.check_target(target_user_id)
+            except TelegramBadRequest as e:
+                sweep['api_errors'] += 1
+                next_check_at = await self.quarantine_target(target_user_id, str(e))
+            except TelegramRetryAfter as e:
+                sweep['flood_waits'] += 1
+                logger.error(f"Ошибка при проверке: {e}")
             except Exception as e:
+                sweep['api_errors'] += 1
                 logger.error(f"Ошибка при проверке: {e}")
+            
+            self.next_check_at[target_user_id] = next_check_at
+            self._dirty_schedule[target_user_id] = next_check_at
+            self.sweep_cursor = target_user_id
+            self.last_progress_at = time.time()
+            
+            checked += 1
+            if checked % MONITOR_CHECKPOINT_EVERY == 0:
+                await self.save_checkpoint()
+        
+        # Обход завершен: следующий начнется с начала
+        self.sweep_cursor = None
+        await self.save_checkpoint()
+        
+        sweep.update(started_at=sweep_started, duration=time.time() - sweep_started, targets=checked)
+        await self.db.record_sweep(sweep)
+    
+    async def quarantine_target(self, target_user_id: int, reason: str) -> float:
+        """Учет неудачной проверки цели, возвращает время следующей попытки
+        
+        Задержка растет экспоненциально (до QUARANTINE_MAX_DELAY). После
+        QUARANTINE_NOTIFY_AFTER неудач подряд владельцы получают одно
+        уведомление о недоступности.
+        """
+        state = self.failures.get(target_user_id, {'failures': 0, 'notified': False})
+        failures = state['failures'] + 1
+        delay = min(CHECK_INTERVAL * 2 ** min(failures, 20), QUARANTINE_MAX_DELAY)
+        next_retry_at = time.time() + delay
+        notify = failures >= QUARANTINE_NOTIFY_AFTER and not state['notified']
+        
+        self.failures[target_user_id] = {
+            'reason': reason,
+            'failures': failures,
+            'next_retry_at': next_retry_at,
+            'notified': state['notified'] or notify,
+        }
+        await self.db.save_target_failure(
+            target_user_id, reason, failures, next_retry_at, state['notified'] or notify
+        )
+        logger.warning(
+            f"Пользователь {target_user_id} недоступен ({failures} раз подряд), "
+            f"следующая попытка через {delay} сек: {reason}"
+        )
+        
+        if notify:
+            for owner_id, _ in self.targets.owners_for(target_user_id):
+                stored = await self.get_stored_profile(owner_id, target_user_id)
+                username = stored['username'] if stored else ''
+                try:
+                    await self.bot.send_message(
+                        owner_id,
+                        f"⚠️ Пользователь @{username or 'нет'} (ID: {target_user_id}) "
+                        f"больше недоступен.\n\n"
+                        f"Возможно, аккаунт удален или ограничил доступ. "
+                        f"Я буду изредка проверять его, а удалить из списка можно командой "
+                        f"/stop {target_user_id}"
+                    )
+                except Exception as e:
+                    logger.error(f"Ошибка при отправке уведомления: {e}")
+        
+        return next_retry_at
+    
+    async def check_target(self, target_user_id: int) -> int:
+        """Проверка одной цели для всех ее владельцев, возвращает число изменений"""
+        current_info = await self.fetch_user_info(target_user_id)
+        if current_info['user_id'] != target_user_id:
+            raise ValueError(f"Получены данные {current_info['user_id']} вместо {target_user_id}")
+        
+        if target_user_id in self.failures:
+            del self.failures[target_user_id]
+            await self.db.clear_target_failure(target_user_id)
+        
+        fingerprint = profile_fingerprint(
+            current_info['username'],
+            current_info['first_name'],
+            current_info['last_name']
+        )
+        
+        changes_found = 0
+        for owner_id, stored_fingerprint in self.targets.owners_for(target_user_id):
+            if stored_fingerprint == fingerprint:
+                continue
+            
+            stored = await self.get_stored_profile(owner_id, target_user_id)
+            if stored is None:
+                continue
+            
+            changes = []
+            for field, display_name in TRACKED_FIELDS:
+                old_value = stored[field] or ''
+                new_value = current_info[field] or ''
+                
+                if old_value != new_value:
+                    changes.append({
+                        'field': field,
+                        'display_name': display_name,
+                        'old': old_value,
+                        'new': new_value
+                    })
+                    
+                    await self.db.update_user_data(
+                        owner_id,
+                        target_user_id,
+                        field,
+                        new_value,
+                        old_value
+                    )
+            
+            self.targets.set_fingerprint(owner_id, target_user_id, fingerprint)
+            
+            if changes:
+                changes_found += len(changes)
+                await self.send_change_notification(owner_id, current_info['username'], changes)
+        
+        return changes_found
     
     async def send_change_notification(self, owner_id: int, username: str, changes: List[Dict]):
         """Отправка уведомления об изменениях"""
@@ -420,20 +2019,206 @@ class UserMonitor:
     async def start_monitoring(self):
         """Запуск мониторинга"""
         self.monitoring = True
+        self.started_at = time.time()
         logger.info("Мониторинг запущен")
         
+        try:
+            await self.restore_checkpoint()
+        except Exception as e:
+            logger.error(f"Не удалось восстановить чекпоинт мониторинга: {e}")
+        
         while self.monitoring:
             try:
+                sweep_started = time.time()
                 await self.check_changes()
+                self.last_sweep_at = time.time()
+                self.last_sweep_duration = self.last_sweep_at - sweep_started
                 await asyncio.sleep(CHECK_INTERVAL)
             except Exception as e:
+                self.last_error = str(e)
                 logger.error(f"Ошибка в цикле мониторинга: {e}")
                 await asyncio.sleep(CHECK_INTERVAL)
 
 
+class Watchdog:
+    """Контроль задержки цикла событий и живости мониторинга
+    
+    Раз в WATCHDOG_INTERVAL измеряет, насколько позже запланированного
+    проснулась задача. Пока цикл опаздывает, отдельный поток снимает
+    стек основного потока (sys._current_frames) и пишет его в лог - не
+    чаще раза в WATCHDOG_DUMP_INTERVAL секунд. Если цикл событий завис
+    полностью, faulthandler через WATCHDOG_STALL_DUMP секунд выводит
+    стеки потоков в stderr.
+    """
+    
+    def __init__(self, monitor: UserMonitor):
+        self.monitor = monitor
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.ready = False
+        # Когда цикл должен проснуться (time.monotonic), читается потоком-сэмплером
+        self._deadline = time.monotonic()
+        self._last_dump = 0.0
+        self._loop_thread_id: Optional[int] = None
+        self._stopped = threading.Event()
+    
+    async def run(self):
+        """Цикл измерения задержки"""
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        threading.Thread(target=self._sample_stacks, name='watchdog-sampler', daemon=True).start()
+        while True:
+            if WATCHDOG_STALL_DUMP > 0:
+                faulthandler.dump_traceback_later(WATCHDOG_STALL_DUMP, repeat=False)
+            
+            expected = loop.time() + WATCHDOG_INTERVAL
+            self._deadline = time.monotonic() + WATCHDOG_INTERVAL
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+            self.lag = max(0.0, loop.time() - expected)
+            self.max_lag = max(self.max_lag, self.lag)
+            
+            if self.lag > WATCHDOG_LAG_THRESHOLD:
+                logger.warning(f"Задержка цикла событий {self.lag:.3f} сек")
+    
+    def stop(self):
+        self._stopped.set()
+        faulthandler.cancel_dump_traceback_later()
+    
+    def _sample_stacks(self):
+        """Поток-сэмплер: стек основного потока, пока цикл событий опаздывает"""
+        # Не чаще 20 раз в секунду, даже при нулевом пороге
+        period = max(0.05, min(WATCHDOG_INTERVAL, WATCHDOG_LAG_THRESHOLD))
+        while not self._stopped.wait(period):
+            late = time.monotonic() - self._deadline
+            if late <= WATCHDOG_LAG_THRESHOLD:
+                continue
+            if time.monotonic() - self._last_dump < WATCHDOG_DUMP_INTERVAL:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._last_dump = time.monotonic()
+            stack = ''.join(traceback.format_stack(frame, limit=20))
+            logger.warning(f"Цикл событий опаздывает на {late:.3f} сек, стек основного потока:\n{stack}")
+    
+    def progress_age(self) -> float:
+        """Секунд с последней проверенной цели или завершенного обхода (или со старта)"""
+        return time.time() - max(
+            self.monitor.last_progress_at or 0,
+            self.monitor.last_sweep_at or 0,
+            self.monitor.started_at,
+        )
+    
+    def sweep_age(self) -> float:
+        """Секунд с последнего завершенного обхода (или со старта мониторинга)"""
+        return time.time() - (self.monitor.last_sweep_at or self.monitor.started_at)
+    
+    def status(self) -> Dict:
+        return {
+            'ready': self.ready,
+            'loop_lag': round(self.lag, 3),
+            'max_loop_lag': round(self.max_lag, 3),
+            'last_progress_age': round(self.progress_age(), 1),
+            'last_sweep_age': round(self.sweep_age(), 1),
+            'last_sweep_duration': round(self.monitor.last_sweep_duration, 1),
+            'monitoring': self.monitor.monitoring,
+            'last_error': self.monitor.last_error,
+        }
+    
+    def is_healthy(self) -> bool:
+        return self.monitor.monitoring and self.progress_age() < WATCHDOG_SWEEP_TIMEOUT
+    
+    async def handle_healthz(self, request: web.Request) -> web.Response:
+        """Живость: мониторинг работает и обход продвигается"""
+        return web.json_response(self.status(), status=200 if self.is_healthy() else 503)
+    
+    async def handle_readyz(self, request: web.Request) -> web.Response:
+        """Готовность: хранилище инициализировано, polling запущен"""
+        return web.json_response(self.status(), status=200 if self.ready else 503)
+    
+    async def start_server(self, port: int) -> web.AppRunner:
+        """Запуск HTTP-сервера с /healthz и /readyz"""
+        app = web.Application()
+        app.router.add_get('/healthz', self.handle_healthz)
+        app.router.add_get('/readyz', self.handle_readyz)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '0.0.0.0', port).start()
+        logger.info(f"Health-check сервер запущен на порту {port}")
+        return runner
+
+
+class BackupManager:
+    """Резервные копии хранилища по расписанию и по команде /backup"""
+    
+    def __init__(self, db: Database, backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+                 mode: str = BACKUP_MODE):
+        self.db = db
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.mode = mode
+        self._lock = asyncio.Lock()
+    
+    def _backup_files(self) -> List[str]:
+        """Существующие копии, от старых к новым"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        return sorted(
+            os.path.join(self.backup_dir, name) for name in os.listdir(self.backup_dir)
+            if name.startswith('darklook-') and not name.endswith('.tmp')
+        )
+    
+    def _prune(self):
+        """Удаление копий сверх BACKUP_KEEP"""
+        files = self._backup_files()
+        for path in files[:max(0, len(files) - self.keep)]:
+            os.remove(path)
+    
+    async def run_backup(self) -> Tuple[str, int, float]:
+        """Создание копии, возвращает (путь, размер в байтах, длительность)"""
+        async with self._lock:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            # Микросекунды в имени: копии в одну секунду не перезаписывают друг друга
+            name = f"darklook-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{self.db.backup_extension}"
+            path = os.path.join(self.backup_dir, name)
+            tmp_path = path + '.tmp'
+            
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self.db.backup(tmp_path, self.mode), BACKUP_TIMEOUT or None)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            duration = time.monotonic() - started
+            
+            self._prune()
+            size = os.path.getsize(path)
+            logger.info(f"Резервная копия {path}: {size} байт за {duration:.2f} сек")
+            return path, size, duration
+    
+    async def run(self, interval: int = BACKUP_INTERVAL):
+        """Периодическое резервное копирование"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run_backup()
+            except Exception as e:
+                logger.error(f"Ошибка при резервном копировании: {e}")
+
+
 # Инициализация
-db = Database(DB_NAME)
+db = create_database()
 monitor = UserMonitor(bot, db)
+watchdog = Watchdog(monitor)
+backups = BackupManager(db)
+
+
+@dp.startup()
+async def on_startup():
+    """Polling запущен - бот готов принимать обновления"""
+    watchdog.ready = True
 
 
 
@@ -466,6 +2251,7 @@ async def cmd_start(message: Message):
 /list - мои отслеживаемые пользователи
 /stop @username - остановить отслеживание
 /info @username - информация о пользователе
+/export - выгрузка истории изменений (csv, jsonl, gz)
 
 <b>Что я отслеживаю:</b>
 • Изменение username
@@ -575,8 +2361,17 @@ async def cmd_track(message: Message):
             )
             return
         
-        # Добавляем в отслеживание
-        success = await db.add_tracked_user(message.from_user.id, user_info)
+        # Добавляем в отслеживание (лимит проверяется атомарно)
+        try:
+            success = await db.add_tracked_user(
+                message.from_user.id, user_info, limit=MAX_TRACKED_USERS_PER_USER
+            )
+        except TrackLimitExceeded:
+            await status_msg.edit_text(
+                f"❌ Достигнут лимит: максимум {MAX_TRACKED_USERS_PER_USER} пользователей.\n"
+                f"Удалите кого-то командой /stop ID"
+            )
+            return
         
         if success:
             await status_msg.edit_text(
@@ -656,7 +2451,15 @@ async def handle_forward(message: Message):
         'last_name': forwarded_user.last_name or ''
     }
     
-    success = await db.add_tracked_user(message.from_user.id, user_data)
+    try:
+        success = await db.add_tracked_user(
+            message.from_user.id, user_data, limit=MAX_TRACKED_USERS_PER_USER
+        )
+    except TrackLimitExceeded:
+        await message.answer(
+            f"❌ Достигнут лимит: максимум {MAX_TRACKED_USERS_PER_USER} пользователей"
+        )
+        return
     
     if success:
         await message.answer(
@@ -789,6 +2592,95 @@ async def cmd_info(message: Message):
     await db.log_action(message.from_user.id, "info", f"ID: {user_id}")
 
 
+# Колонки выгрузки истории изменений
+EXPORT_FIELDS = ('changed_at', 'target_user_id', 'field_name', 'old_value', 'new_value')
+
+
+def format_export_rows(rows: List[Tuple], fmt: str) -> str:
+    """Форматирование страницы истории в CSV или JSONL"""
+    if fmt == 'jsonl':
+        return ''.join(
+            json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n'
+            for row in rows
+        )
+    
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
+
+
+async def write_history_export(owner_id: int, path: str, fmt: str, compress: bool) -> int:
+    """Потоковая запись истории владельца в файл, возвращает число строк"""
+    opener = gzip.open if compress else open
+    count = 0
+    
+    with opener(path, 'wt', encoding='utf-8', newline='') as out:
+        if fmt == 'csv':
+            out.write(','.join(EXPORT_FIELDS) + '\n')
+        
+        async for rows in db.iter_change_history(owner_id):
+            chunk = format_export_rows(rows, fmt)
+            await asyncio.to_thread(out.write, chunk)
+            count += len(rows)
+    
+    return count
+
+
+@dp.message(Command("export"))
+async def cmd_export(message: Message):
+    """Команда /export [csv|jsonl] [gz]"""
+    await db.add_bot_user(
+        message.from_user.id,
+        message.from_user.username or '',
+        message.from_user.first_name or ''
+    )
+    
+    if not RateLimiter.check_cooldown(message.from_user.id):
+        await message.answer("⏳ Подождите между командами")
+        return
+    
+    if not RateLimiter.check_rate_limit(message.from_user.id):
+        await message.answer("⏳ Слишком много запросов")
+        return
+    
+    options = [part.lower() for part in message.text.split()[1:]]
+    fmt = 'jsonl' if 'jsonl' in options else 'csv'
+    compress = 'gz' in options or 'gzip' in options
+    
+    filename = f"darklook_history_{message.from_user.id}.{fmt}" + ('.gz' if compress else '')
+    fd, path = tempfile.mkstemp(suffix='.' + filename)
+    os.close(fd)
+    
+    status_msg = await message.answer("📦 Готовлю выгрузку истории...")
+    
+    try:
+        count = await write_history_export(message.from_user.id, path, fmt, compress)
+        
+        if not count:
+            await status_msg.edit_text("📭 История изменений пока пуста")
+            return
+        
+        if os.path.getsize(path) > EXPORT_MAX_FILE_SIZE:
+            await status_msg.edit_text(
+                "❌ Файл слишком большой для отправки.\n"
+                "Попробуйте сжатую выгрузку: /export csv gz"
+            )
+            return
+        
+        await message.answer_document(
+            FSInputFile(path, filename=filename),
+            caption=f"📜 История изменений: {count} записей"
+        )
+        await status_msg.delete()
+        await db.log_action(message.from_user.id, "export", f"{fmt}, записей: {count}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в export: {e}")
+        await status_msg.edit_text("❌ Ошибка при выгрузке истории")
+    finally:
+        os.remove(path)
+
+
 # Админские команды
 @dp.message(Command("admin"))
 async def cmd_admin(message: Message):
@@ -802,6 +2694,7 @@ async def cmd_admin(message: Message):
 /stats - статистика бота
 /users - список всех пользователей
 /logs - последние действия
+/backup - резервная копия базы
 /broadcast - рассылка (в разработке)
     """
     
@@ -809,6 +2702,59 @@ async def cmd_admin(message: Message):
 
 
 
+SPARKLINE_CHARS = '▁▂▃▄▅▆▇█'
+
+
+def format_seconds(value: Optional[float]) -> str:
+    """Граница корзины длительности для вывода"""
+    if value is None:
+        return '—'
+    if value == float('inf'):
+        return f">{SWEEP_DURATION_BUCKETS[-1]}с"
+    return f"≤{value:g}с"
+
+
+async def render_sweep_trends() -> str:
+    """Тренды мониторинга по агрегатам обходов (без чтения сырых записей)"""
+    now = time.time()
+    day_start = int(now // 3600 * 3600) - 23 * 3600
+    hourly = await db.get_sweep_rollups('hour', day_start)
+    last_hour = await db.get_sweep_rollups('minute', now - 3600)
+    
+    if not hourly:
+        return "\n⏱ <b>Мониторинг:</b> данных об обходах пока нет\n"
+    
+    day = merge_rollups(hourly)
+    hour = merge_rollups(last_hour)
+    p95_day = histogram_percentile(day['histogram'], 0.95)
+    status = '✅' if p95_day is not None and p95_day <= CHECK_INTERVAL else '⚠️'
+    
+    # p95 по часам за последние 24 часа
+    by_bucket = {rollup['bucket']: rollup for rollup in hourly}
+    p95_hours = [
+        histogram_percentile(by_bucket[bucket]['histogram'], 0.95) if bucket in by_bucket else None
+        for bucket in range(day_start, day_start + 24 * 3600, 3600)
+    ]
+    finite = [value for value in p95_hours if value is not None and value != float('inf')]
+    top = max(finite, default=0) or 1
+    sparkline = ''.join(
+        '·' if value is None else
+        SPARKLINE_CHARS[-1] if value == float('inf') else
+        SPARKLINE_CHARS[min(len(SPARKLINE_CHARS) - 1, int(value / top * (len(SPARKLINE_CHARS) - 1)))]
+        for value in p95_hours
+    )
+    
+    return f"""
+⏱ <b>Мониторинг за 24ч:</b>
+Обходов: {day['sweeps']}, целей за обход: {day['targets'] / day['sweeps']:.0f}
+Длительность p95: {format_seconds(p95_day)} при интервале {CHECK_INTERVAL}с {status}
+Средняя / макс.: {day['duration_sum'] / day['sweeps']:.1f}с / {day['duration_max']:.1f}с
+За последний час p95: {format_seconds(histogram_percentile(hour['histogram'], 0.95))}
+Ошибки API: {day['api_errors']}, flood wait: {day['flood_waits']}, изменений: {day['changes']}
+p95 по часам: <code>{sparkline}</code>
+"""
+
+
 @dp.message(Command("stats"))
 async def cmd_stats(message: Message):
     """Статистика бота (только для админа)"""
@@ -824,7 +2770,7 @@ async def cmd_stats(message: Message):
 👥 Всего пользователей: {len(bot_users)}
 🔍 Всего отслеживаний: {len(tracked)}
 📈 Среднее на пользователя: {len(tracked) / len(bot_users) if bot_users else 0:.1f}
-
+{await render_sweep_trends()}
 <b>Последние 5 пользователей:</b>
     """
     
@@ -882,42 +2828,113 @@ async def cmd_logs(message: Message):
     await message.answer(text, parse_mode='HTML')
 
 
+@dp.message(Command("backup"))
+async def cmd_backup(message: Message):
+    """Резервная копия базы (только для админа)"""
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    status_msg = await message.answer("💾 Создаю резервную копию...")
+    
+    try:
+        path, size, duration = await backups.run_backup()
+    except Exception as e:
+        logger.error(f"Ошибка в backup: {e}")
+        await status_msg.edit_text(f"❌ Ошибка: {str(e)}")
+        return
+    
+    await status_msg.edit_text(
+        f"✅ <b>Резервная копия создана</b>\n\n"
+        f"📁 Файл: <code>{path}</code>\n"
+        f"📦 Размер: {size / 1024 / 1024:.2f} МБ\n"
+        f"⏱ Время: {duration:.2f} сек",
+        parse_mode='HTML'
+    )
+
+
+async def timed_phase(name: str, coro, timings: Dict[str, float]):
+    """Выполнение фазы старта с замером длительности"""
+    started = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[name] = time.perf_counter() - started
+
+
+async def notify_admin_started():
+    """Уведомление админу о запуске"""
+    try:
+        await bot.send_message(ADMIN_ID, "🚀 DarkLook запущен!")
+    except:
+        pass
+
+
 async def main():
     """Главная функция"""
+    main_started = time.perf_counter()
+    timings = {'загрузка модуля': main_started - MODULE_LOAD_STARTED}
+    health_runner = None
+    backup_task: Optional[asyncio.Task] = None
+    notify_task: Optional[asyncio.Task] = None
+    watchdog_task = asyncio.create_task(watchdog.run())
     try:
         logger.info(f"Запуск бота с ADMIN_ID={ADMIN_ID}, BOT_TOKEN={'установлен' if BOT_TOKEN else 'НЕ установлен'}")
         
-        await db.init_db()
+        # Telethon импортируется и подключается в фоне, не задерживая старт
+        start_telethon()
         
-        # Запуск Telethon клиента (если настроен)
-        if telethon_client:
-            try:
-                await telethon_client.start()
-                logger.info("Telethon клиент запущен")
-            except Exception as e:
-                logger.warning(f"Не удалось запустить Telethon: {e}")
+        # Независимые фазы старта выполняются параллельно
+        phases = [
+            timed_phase('база данных', db.init_db(), timings),
+            timed_phase('Bot API (getMe)', bot.me(), timings),
+        ]
+        if HEALTH_PORT:
+            phases.append(timed_phase('health-сервер', watchdog.start_server(HEALTH_PORT), timings))
+        results = await asyncio.gather(*phases)
+        if HEALTH_PORT:
+            health_runner = results[-1]
         
         # Запуск мониторинга в фоне
         monitoring_task = asyncio.create_task(monitor.start_monitoring())
         
-        logger.info("Бот запущен")
+        if BACKUP_INTERVAL > 0:
+            backup_task = asyncio.create_task(backups.run())
         
-        # Уведомление админу
-        try:
-            await bot.send_message(ADMIN_ID, "🚀 DarkLook запущен!")
-        except:
-            pass
+        # Уведомление админу не задерживает запуск polling
+        notify_task = asyncio.create_task(notify_admin_started())
+        
+        timings['всего до polling'] = time.perf_counter() - MODULE_LOAD_STARTED
+        logger.info("Бот запущен. Фазы старта: " + ", ".join(
+            f"{name}={duration:.3f}с" for name, duration in timings.items()
+        ))
         
-        await dp.start_polling(bot)
+        # Обновления запускает UpdateExecutor, а не отдельная задача на каждое
+        await dp.start_polling(bot, handle_as_tasks=False)
         
     except KeyboardInterrupt:
         logger.info("Остановка бота")
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
     finally:
+        watchdog.ready = False
+        await update_executor.drain()
+        watchdog_task.cancel()
+        watchdog.stop()
+        # Фоновые задачи останавливаются до закрытия хранилища
+        for task in (backup_task, notify_task):
+            if task and not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if health_runner:
+            await health_runner.cleanup()
+        if _telethon_task and not _telethon_task.done():
+            _telethon_task.cancel()
         if telethon_client:
             await telethon_client.disconnect()
+        await db.close()
         await bot.session.close()
+        if isinstance(bot.session, RecordingSession):
+            bot.session.finish()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+os.environ.setdefault('BOT_TOKEN', '123456:ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghi')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from main import BackupManager, SQLiteDatabase
+
+
+class BackupTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.backup_dir = os.path.join(self.dir, 'backups')
+        self.db = SQLiteDatabase(os.path.join(self.dir, 'darklook.db'))
+        await self.db.init_db()
+        # ~4 МБ истории, чтобы копия шла много шагов
+        for _ in range(40):
+            await self.db.update_user_data(1, 2, 'username', 'x' * 100000, 'y')
+
+        self.saved = main.BACKUP_PAGES_PER_STEP, main.BACKUP_STEP_SLEEP, main.BACKUP_TIMEOUT
+        main.BACKUP_PAGES_PER_STEP, main.BACKUP_STEP_SLEEP = 16, 0.01
+
+    async def asyncTearDown(self):
+        main.BACKUP_PAGES_PER_STEP, main.BACKUP_STEP_SLEEP, main.BACKUP_TIMEOUT = self.saved
+        shutil.rmtree(self.dir)
+
+    def leftovers(self):
+        return [name for name in os.listdir(self.backup_dir) if name.endswith('.tmp')]
+
+    async def test_backup_finishes_while_writing(self):
+        backups = BackupManager(self.db, self.backup_dir, keep=5)
+        writing = True
+
+        async def writer():
+            while writing:
+                await self.db.log_action(1, 'write')
+                await asyncio.sleep(0.02)
+
+        writer_task = asyncio.create_task(writer())
+        try:
+            with self.assertLogs('main', 'WARNING') as logs:
+                path, size, duration = await asyncio.wait_for(backups.run_backup(), 30)
+        finally:
+            writing = False
+            await writer_task
+
+        self.assertIn('одним шагом', '\n'.join(logs.output))
+
+        with sqlite3.connect(path) as copy:
+            self.assertEqual(copy.execute("SELECT COUNT(*) FROM change_history").fetchone()[0], 40)
+        self.assertEqual(self.leftovers(), [])
+
+    async def test_timeout_releases_lock_and_removes_tmp(self):
+        main.BACKUP_TIMEOUT = 0.05
+        backups = BackupManager(self.db, self.backup_dir, keep=5)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await backups.run_backup()
+
+        self.assertFalse(backups._lock.locked())
+        self.assertEqual(self.leftovers(), [])
+
+    async def test_backups_in_same_second_are_kept(self):
+        main.BACKUP_PAGES_PER_STEP = -1
+        backups = BackupManager(self.db, self.backup_dir, keep=5)
+
+        first = await backups.run_backup()
+        second = await backups.run_backup()
+
+        self.assertNotEqual(first[0], second[0])
+        self.assertEqual(len(backups._backup_files()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import sys
+import unittest
+
+os.environ.setdefault('BOT_TOKEN', '123456:ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghi')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Dispatcher
+from aiogram.types import Update
+
+from main import UpdateExecutor
+
+
+class UpdateExecutorTest(unittest.IsolatedAsyncioTestCase):
+    async def test_user_updates_run_in_order(self):
+        executor = UpdateExecutor(concurrency=4, queue_limit=100, user_queue_limit=100)
+        done = []
+
+        def job(user_id, n):
+            async def run():
+                # Более поздние обновления завершаются быстрее
+                await asyncio.sleep(0.01 * (5 - n))
+                done.append((user_id, n))
+            return run
+
+        for n in range(5):
+            for user_id in (1, 2):
+                self.assertTrue(await executor.submit(user_id, job(user_id, n)))
+        await executor.drain()
+
+        for user_id in (1, 2):
+            self.assertEqual([n for uid, n in done if uid == user_id], list(range(5)))
+        self.assertEqual(executor.pending, 0)
+
+    async def test_concurrency_limit(self):
+        executor = UpdateExecutor(concurrency=2, queue_limit=100, user_queue_limit=100)
+        running = 0
+        peak = 0
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        for user_id in range(10):
+            await executor.submit(user_id, job)
+        await executor.drain()
+
+        self.assertEqual(peak, 2)
+
+    async def test_global_queue_limit_blocks_submit(self):
+        executor = UpdateExecutor(concurrency=1, queue_limit=3, user_queue_limit=100)
+        release = asyncio.Event()
+
+        async def job():
+            await release.wait()
+
+        for user_id in range(3):
+            await executor.submit(user_id, job)
+        blocked = asyncio.create_task(executor.submit(3, job))
+        await asyncio.sleep(0.01)
+        self.assertFalse(blocked.done())
+        self.assertEqual(executor.pending, 3)
+
+        release.set()
+        self.assertTrue(await asyncio.wait_for(blocked, 1))
+        await executor.drain()
+        self.assertEqual(executor.pending, 0)
+
+    async def test_user_queue_limit_drops_extra_updates(self):
+        executor = UpdateExecutor(concurrency=1, queue_limit=10, user_queue_limit=2)
+        release = asyncio.Event()
+        done = []
+
+        def job(n):
+            async def run():
+                await release.wait()
+                done.append(n)
+            return run
+
+        # Первое обновление выполняется, еще два ждут в очереди
+        results = []
+        for n in range(5):
+            results.append(await executor.submit(1, job(n)))
+            await asyncio.sleep(0)
+        self.assertEqual(results, [True, True, True, False, False])
+        self.assertEqual(executor.dropped, 2)
+
+        # Отброшенные обновления не заняли общий лимит: другой пользователь принимается сразу
+        self.assertTrue(await asyncio.wait_for(executor.submit(2, job(10)), 1))
+
+        release.set()
+        await executor.drain()
+        self.assertEqual(sorted(done), [0, 1, 2, 10])
+        self.assertEqual([n for n in done if n < 10], [0, 1, 2])
+        self.assertEqual(executor.pending, 0)
+
+
+    async def test_handler_errors_reach_dispatcher(self):
+        executor = UpdateExecutor(concurrency=1, queue_limit=10, user_queue_limit=10)
+        dp = Dispatcher()
+        errors = []
+
+        @dp.errors()
+        async def on_error(event):
+            errors.append(event.exception)
+            return True
+
+        async def handler(event, data):
+            raise ValueError('boom')
+
+        update = Update(update_id=1)
+        await executor.middleware(handler, update, {'dispatcher': dp, 'event_from_user': None})
+        await executor.drain()
+
+        self.assertEqual([str(e) for e in errors], ['boom'])
+
+
+if __name__ == '__main__':
+    unittest.main()